@@ -1,17 +1,80 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from array import array
 from multiprocessing import Pool, cpu_count
-from collections import defaultdict
+from collections import defaultdict, Counter
 import mmap
 import time
+import re
+import json
+import hashlib
+import argparse
 
-def process_lines(lines):
+# re.ASCII keeps \d to 0-9, other Unicode digits would otherwise pass and parse
+LINE_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2}): (\+?\d*\((\d{3})\)[\d-]+)', re.ASCII)
+
+class TooManyRejectsError(ValueError):
+    """
+    Raised once more than `max_rejects` lines were rejected. `rejects` holds the
+    rejected lines gathered up to that point so they can still be written out.
+    """
+    def __init__(self, message, rejects=()):
+        super().__init__(message)
+        self.rejects = list(rejects)
+
+    def __reduce__(self):
+        # Keep the rejects when the error is pickled back from a Pool worker
+        return type(self), (self.args[0], self.rejects)
+
+def process_lines(lines, file_name=None, offset=0, rejects=None, max_rejects=None):
+    """
+    Groups the night time calls in `lines` by area code and phone number.
+
+    All lines are first matched against `LINE_PATTERN` in one bulk pass, so the
+    good path only pays for a single regex match instead of the repeated string
+    splitting and `strptime`. Blank lines are skipped. Lines that do not match,
+    hold bytes that are not valid UTF-8 (decoded with 'surrogateescape'), or
+    whose timestamp is not a valid date, are appended to `rejects` as
+    (file_name, byte offset, reason, line) instead of raising, where `offset`
+    is the byte offset of the first line in the file. If more than
+    `max_rejects` lines are rejected a TooManyRejectsError is raised.
+    """
     local_phone_calls_dict = {}
+    if rejects is None:
+        rejects = []
+    stripped = list(map(str.strip, lines))
+    matches = list(map(LINE_PATTERN.fullmatch, stripped))
+    # Byte offsets are only needed for rejected lines, so they are computed lazily
+    offset_index = 0
+
+    for i, match in enumerate(matches):
+        if match is None:
+            if not stripped[i]:
+                continue
+            try:
+                lines[i].encode('utf-8')
+            except UnicodeEncodeError:
+                reason = 'invalid encoding'
+            else:
+                reason = 'malformed'
+        else:
+            year, month, day, hour, minute, second, phone_number, area_code = match.groups()
+            try:
+                # The pattern already fixed the layout, so building the datetime
+                # from the captured fields is enough to validate the date
+                timestamp = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+            except ValueError:
+                reason = 'invalid timestamp'
+            else:
+                reason = None
 
-    for line in lines:
-        timestamp_str, phone_number = line.strip().split(': ')
-        area_code = phone_number.split('(')[1][:3]
-        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+        if reason is not None:
+            offset += len(''.join(lines[offset_index:i]).encode('utf-8', 'surrogateescape'))
+            offset_index = i
+            rejects.append((file_name, offset, reason, lines[i].rstrip('\r\n')))
+            if max_rejects is not None and len(rejects) > max_rejects:
+                raise TooManyRejectsError(f"More than {max_rejects} rejected lines, last at {file_name}:{offset}", rejects)
+            continue
 
         if 0 <= timestamp.hour < 6:
             if area_code not in local_phone_calls_dict:
@@ -22,6 +85,12 @@ def process_lines(lines):
 
     return local_phone_calls_dict
 
+def process_chunk(chunk):
+    file_name, offset, lines, max_rejects = chunk
+    rejects = []
+    local_phone_calls_dict = process_lines(lines, file_name, offset, rejects, max_rejects)
+    return local_phone_calls_dict, rejects
+
 def read_file(file_name):
     """
     Reads the contents of a file using memory mapping.
@@ -49,7 +118,9 @@ def read_file(file_name):
         file should be mapped for reading.The lines of the file are read using the 
         `readline` method of the memory-mapped file object. Each line is decoded from bytes 
         to string using the UTF-8 encoding, which is a widely used character encoding 
-        that can represent any character in the Unicode standard. The decoded lines are appended 
+        that can represent any character in the Unicode standard. Invalid bytes are kept 
+        as surrogates ('surrogateescape') so `process_lines` can reject just that line 
+        instead of the whole file failing to decode. The decoded lines are appended 
         to a list, which is returned as the result of the function.The function raises a `FileNotFoundError` 
         exception if the specified file does not exist.
     """
@@ -60,11 +131,59 @@ def read_file(file_name):
         line = mmapped_file.readline()  
         while line:
             # Decode the line from bytes to string using UTF-8 encoding
-            lines.append(line.decode('utf-8'))  
+            lines.append(line.decode('utf-8', 'surrogateescape'))  
             line = mmapped_file.readline()  
     return lines
 
-def load_phone_calls_dict(data_dir):
+def build_chunks(files, all_lines_lists, num_chunks, max_rejects=None):
+    """
+    Splits the lines of every file into roughly `num_chunks` chunks for
+    `process_chunk`. A chunk never spans two files and carries the byte offset
+    of its first line, so rejected lines can be reported with their location.
+    """
+    chunk_size = max(1, sum(map(len, all_lines_lists)) // num_chunks)
+    chunks = []
+    for file_name, lines in zip(files, all_lines_lists):
+        offset = 0
+        for i in range(0, len(lines), chunk_size):
+            chunk = lines[i:i + chunk_size]
+            chunks.append((file_name, offset, chunk, max_rejects))
+            offset += len(''.join(chunk).encode('utf-8', 'surrogateescape'))
+    return chunks
+
+def process_chunks(pool, chunks, reject_file='rejects.txt', max_rejects=None):
+    """
+    Runs `process_chunk` over `chunks` on `pool` and merges the results as they
+    arrive. Once more than `max_rejects` lines are rejected, either within one
+    chunk or in total, the pool is terminated, every reject gathered so far is
+    written to `reject_file` and a TooManyRejectsError is raised.
+    Returns the phone calls dict and a Counter of rejected lines per reason.
+    """
+    phone_calls_dict = defaultdict(lambda: defaultdict(list))
+    rejects = []
+    exceeded = False
+
+    try:
+        for local_dict, local_rejects in pool.imap_unordered(process_chunk, chunks):
+            rejects.extend(local_rejects)
+            for area_code, numbers in local_dict.items():
+                for phone_number, timestamps in numbers.items():
+                    phone_calls_dict[area_code][phone_number].extend(timestamps)
+            if max_rejects is not None and len(rejects) > max_rejects:
+                exceeded = True
+                break
+    except TooManyRejectsError as e:
+        rejects.extend(e.rejects)
+        exceeded = True
+
+    if exceeded:
+        pool.terminate()
+    export_rejects(rejects, reject_file)
+    if exceeded:
+        raise TooManyRejectsError(f"{len(rejects)} rejected lines exceed the limit of {max_rejects}, see {reject_file}", rejects)
+    return phone_calls_dict, Counter(reason for _, _, reason, _ in rejects)
+
+def load_phone_calls_dict(data_dir, reject_file='rejects.txt', max_rejects=None):
     """
     Multiprocessing is a Python module that allows you to run multiple 
     processes in parallel, which can be useful for tasks that 
@@ -76,31 +195,42 @@ def load_phone_calls_dict(data_dir):
     it also introduces its own overhead by spawning its own python interpreter
     with its own memory space. This leads to a trade between memory usage
     for faster processing time.
-    """
-    phone_calls_dict = defaultdict(lambda: defaultdict(list))
-    #phone_calls_dict = {}
 
+    Parameters:
+        data_dir (str): Directory holding the `phone_calls*.txt` files.
+        reject_file (str): Where malformed lines are written, with their file
+            and byte offset. Nothing is written, and a stale file is removed,
+            when every line is valid.
+        max_rejects (int): If set, the run stops with a TooManyRejectsError as
+            soon as more than this many lines have been rejected.
+
+    Returns:
+        tuple: The phone calls dict ({area_code: {phone_number: [datetime]}})
+        and a Counter of rejected lines per reason.
+    """
     files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith('phone_calls') and f.endswith('.txt')]
     num_processes = cpu_count()
     
     with Pool(num_processes) as pool:
         all_lines_lists = pool.map(read_file, files)
         
-    all_lines = [line for sublist in all_lines_lists for line in sublist]
-    chunk_size = len(all_lines) // num_processes
-    chunks = [all_lines[i:i + chunk_size] for i in range(0, len(all_lines), chunk_size)]
+    chunks = build_chunks(files, all_lines_lists, num_processes, max_rejects)
     
     with Pool(num_processes) as pool:
-        results = pool.map(process_lines, chunks)
+        return process_chunks(pool, chunks, reject_file, max_rejects)
 
-    for local_dict in results:
-        for area_code, numbers in local_dict.items():
-            for phone_number, timestamps in numbers.items():
-                phone_calls_dict[area_code][phone_number].extend(timestamps)
-    
-    #plain_dict = {k: dict(v) for k, v in phone_calls_dict.items()}
-    #return plain_dict
-    return phone_calls_dict
+def export_rejects(rejects, reject_file):
+    if not rejects:
+        # Do not leave the rejects of an earlier run behind
+        try:
+            os.remove(reject_file)
+        except FileNotFoundError:
+            pass
+        return
+    # surrogateescape writes undecodable lines back as their original bytes
+    with open(reject_file, 'w', encoding='utf-8', errors='surrogateescape') as file:
+        for file_name, offset, reason, line in rejects:
+            file.write(f"{file_name}\t{offset}\t{reason}\t{line}\n")
 
 def generate_phone_call_counts(phone_calls_dict):
     phone_call_counts = {}
@@ -123,15 +253,77 @@ def export_phone_call_counts(most_frequent_list, out_file_path):
         for phone_number, count in most_frequent_list:
             output_file.write(f"{phone_number}: {count}\n")
 
-def export_redials_report(phone_calls_dict, report_dir):
+FINGERPRINT_FILE = '.fingerprints.json'
+FINGERPRINT_VERSION = 3
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+def load_fingerprints(report_dir):
+    """
+    Returns the {area_code: digest} mapping saved by `save_fingerprints`. A
+    missing, unreadable or differently shaped file counts as no fingerprints,
+    which only means every report is regenerated.
+    """
+    try:
+        with open(os.path.join(report_dir, FINGERPRINT_FILE), 'r') as file:
+            fingerprints = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(fingerprints, dict) or fingerprints.get('version') != FINGERPRINT_VERSION:
+        return {}
+    areas = fingerprints.get('areas')
+    if not isinstance(areas, dict) or not all(isinstance(digest, str) for digest in areas.values()):
+        return {}
+    return areas
+
+def write_atomic(path, content):
+    # Write to a temporary file and rename it over `path`, so a crash never
+    # leaves a truncated file that a later run could mistake for up to date
+    with open(path + '.tmp', 'w') as file:
+        file.write(content)
+    os.replace(path + '.tmp', path)
+
+def save_fingerprints(fingerprints, report_dir):
+    content = json.dumps({'version': FINGERPRINT_VERSION, 'areas': fingerprints}, indent=2, sort_keys=True)
+    write_atomic(os.path.join(report_dir, FINGERPRINT_FILE), content)
+
+def export_redials_report(phone_calls_dict, report_dir, force=False):
+    """
+    Writes one `<area_code>.txt` redials report per area code.
+
+    A digest of every area's numbers and sorted timestamps is kept in
+    `report_dir/.fingerprints.json`. On later runs an area whose digest is
+    unchanged and whose report file still exists is skipped entirely, so its
+    file is left untouched. `force` regenerates every report. Reports of area
+    codes that were fingerprinted before but are missing from the input are
+    deleted along with their fingerprint.
+    Returns the list of area codes whose reports were written.
+    """
     os.makedirs(report_dir, exist_ok=True)
+    previous_fingerprints = load_fingerprints(report_dir)
+    fingerprints = {} if force else previous_fingerprints
+    new_fingerprints = {}
+    written = []
 
     for area_code, ac_data in phone_calls_dict.items():
-        report = []  
+        report_path = os.path.join(report_dir, f"{area_code}.txt")
+        sorted_calls = [(phone_number, sorted(call_data)) for phone_number, call_data in sorted(ac_data.items())]
+
+        # Hashing the timestamps as packed epoch microseconds is several times
+        # cheaper than formatting them
+        digest = hashlib.blake2b(digest_size=16)
+        for phone_number, sorted_timestamps in sorted_calls:
+            digest.update(f"{phone_number}:{len(sorted_timestamps)}\n".encode('utf-8'))
+            digest.update(array('q', [(timestamp - EPOCH) // MICROSECOND for timestamp in sorted_timestamps]).tobytes())
+        fingerprint = digest.hexdigest()
+        new_fingerprints[area_code] = fingerprint
 
-        for phone_number, call_data in sorted(ac_data.items()):
-            sorted_timestamps = sorted(call_data)
+        if fingerprints.get(area_code) == fingerprint and os.path.exists(report_path):
+            continue
 
+        report = []  
+
+        for phone_number, sorted_timestamps in sorted_calls:
             for i in range(len(sorted_timestamps) - 1):
                 timestamp_1 = sorted_timestamps[i]
                 timestamp_2 = sorted_timestamps[i + 1]
@@ -147,19 +339,38 @@ def export_redials_report(phone_calls_dict, report_dir):
                     line = f"{phone_number}: {time_str_1} -> {time_str_2} ({duration_str})"
                     report.append(line)
         
-        with open(os.path.join(report_dir, f"{area_code}.txt"), 'w') as file:
-            if report:
-                file.write('\n'.join(report)+'\n')
+        write_atomic(report_path, '\n'.join(report)+'\n' if report else '')
+        written.append(area_code)
+
+    stale = set(previous_fingerprints) - set(phone_calls_dict)
+    for area_code in stale:
+        try:
+            os.remove(os.path.join(report_dir, f"{area_code}.txt"))
+        except FileNotFoundError:
+            pass
+
+    if written or new_fingerprints != previous_fingerprints:
+        save_fingerprints(new_fingerprints, report_dir)
+    return written
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--force-full-report', action='store_true', help="rewrite every redials report file")
+    parser.add_argument('--reject-file', default='rejects.txt', help="where malformed lines are written")
+    parser.add_argument('--max-rejects', type=int, default=None, help="fail once more than this many lines are rejected")
+    args = parser.parse_args()
+
     start_time = time.time()
     data_dir = 'data' 
     #file = jload_phone_calls_dict(data_dir)
-    phone_calls_dict = load_phone_calls_dict(data_dir)
+    phone_calls_dict, reject_counts = load_phone_calls_dict(data_dir, args.reject_file, args.max_rejects)
+    if reject_counts:
+        print(f"Rejected {sum(reject_counts.values())} lines: {dict(reject_counts)}")
     phone_call_counts = generate_phone_call_counts(phone_calls_dict)
     most_frequent_list = most_frequently_called(phone_call_counts, 10)
     export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
-    export_redials_report(phone_calls_dict, 'redials_report')
+    written = export_redials_report(phone_calls_dict, 'redials_report', force=args.force_full_report)
+    print(f"Rewrote {len(written)} of {len(phone_calls_dict)} redials report files")
     stop_time = time.time()
     print(f"Execution time: {stop_time - start_time} seconds")
 
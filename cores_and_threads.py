@@ -1,97 +1,25 @@
 import os
-from datetime import datetime
 from multiprocessing import Pool, cpu_count
-from collections import defaultdict
-import mmap
 import time
 from concurrent.futures import ThreadPoolExecutor
 
-def process_lines(lines):
-    local_phone_calls_dict = {}
-
-    for line in lines:
-        timestamp_str, phone_number = line.strip().split(': ')
-        area_code = phone_number.split('(')[1][:3]
-        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-
-        if 0 <= timestamp.hour < 6:
-            if area_code not in local_phone_calls_dict:
-                local_phone_calls_dict[area_code] = {}
-            if phone_number not in local_phone_calls_dict[area_code]:
-                local_phone_calls_dict[area_code][phone_number] = []
-            local_phone_calls_dict[area_code][phone_number].append(timestamp)
-
-    return local_phone_calls_dict
-
-def read_file(file_name):
-    """
-    Reads the contents of a file using memory mapping.
-
-    Parameters:
-        file_name (str): The name of the file to read.
-
-    Returns:
-        list: A list of strings representing the lines in the file.
-
-    Raises:
-        FileNotFoundError: If the specified file does not exist.
-
-    Technical Details:
-        The `mmap` module is used to memory map the file for reading. 
-        Memory mapping is a technique that allows a file to be mapped into 
-        memory so that it can be accessed like an array. This can be more 
-        efficient than reading the file using traditional I/O operations 
-        because it avoids the overhead of copying data between the file and memory.
-        The `mmap.mmap` function is used to memory map the file for reading. 
-        The `fileno` method of the file object is used to get the file descriptor, 
-        which is passed as the first argument to `mmap.mmap`. The second argument 
-        s the length of the memory map, which is set to 0 to map the entire file. 
-        the `access` argument is set to `mmap.ACCESS_READ` to indicate that the 
-        file should be mapped for reading.The lines of the file are read using the 
-        `readline` method of the memory-mapped file object. Each line is decoded from bytes 
-        to string using the UTF-8 encoding, which is a widely used character encoding 
-        that can represent any character in the Unicode standard. The decoded lines are appended 
-        to a list, which is returned as the result of the function.The function raises a `FileNotFoundError` 
-        exception if the specified file does not exist.
-    """
-    with open(file_name, "r") as f:
-        # Memory map the file for reading
-        mmapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        lines = []
-        line = mmapped_file.readline()  
-        while line:
-            # Decode the line from bytes to string using UTF-8 encoding
-            lines.append(line.decode('utf-8'))  
-            line = mmapped_file.readline()  
-    return lines
+from cores import read_file, build_chunks, process_chunks
 
 def parallel_file_reading(files):
     with ThreadPoolExecutor() as executor:
         return list(executor.map(read_file, files))
 
-def load_phone_calls_dict(data_dir):
-    phone_calls_dict = defaultdict(lambda: defaultdict(list))
-
+def load_phone_calls_dict(data_dir, reject_file='rejects.txt', max_rejects=None):
     files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith('phone_calls') and f.endswith('.txt')]
     
     # Use threads to read multiple files in parallel.
     all_lines_lists = parallel_file_reading(files)
     
-    all_lines = [line for sublist in all_lines_lists for line in sublist]
-    
     num_processes = cpu_count()
-    chunk_size = len(all_lines) // num_processes
-    chunks = [all_lines[i:i + chunk_size] for i in range(0, len(all_lines), chunk_size)]
+    chunks = build_chunks(files, all_lines_lists, num_processes, max_rejects)
     
     with Pool(num_processes) as pool:
-        results = pool.map(process_lines, chunks)
-
-    for local_dict in results:
-        for area_code, numbers in local_dict.items():
-            for phone_number, timestamps in numbers.items():
-                phone_calls_dict[area_code][phone_number].extend(timestamps)
-    
-    return phone_calls_dict
+        return process_chunks(pool, chunks, reject_file, max_rejects)
 
 def generate_phone_call_counts(phone_calls_dict):
     phone_call_counts = {}
@@ -146,7 +74,9 @@ def main():
     start_time = time.time()
     data_dir = 'data' 
     #file = jload_phone_calls_dict(data_dir)
-    phone_calls_dict = load_phone_calls_dict(data_dir)
+    phone_calls_dict, reject_counts = load_phone_calls_dict(data_dir)
+    if reject_counts:
+        print(f"Rejected {sum(reject_counts.values())} lines: {dict(reject_counts)}")
     phone_call_counts = generate_phone_call_counts(phone_calls_dict)
     most_frequent_list = most_frequently_called(phone_call_counts, 10)
     export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
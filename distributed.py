@@ -0,0 +1,355 @@
+import os
+import mmap
+import time
+import argparse
+import threading
+from collections import defaultdict, deque, Counter
+from datetime import datetime, timedelta
+from multiprocessing import Process
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from cores import (
+    TooManyRejectsError,
+    process_lines,
+    export_rejects,
+    generate_phone_call_counts,
+    most_frequently_called,
+    export_phone_call_counts,
+    export_redials_report,
+)
+
+EPOCH = datetime(1970, 1, 1)
+DEFAULT_ADDRESS = ('localhost', 6000)
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_WORKER_TIMEOUT = 60
+DEFAULT_TASK_TIMEOUT = 600
+AUTHKEY_ENV = 'PHONE_CALLS_AUTHKEY'
+
+def read_authkey(authkey_file=None):
+    """
+    Returns the shared secret from `authkey_file`, or from the PHONE_CALLS_AUTHKEY
+    environment variable. Messages between coordinator and workers are pickled,
+    so anyone holding the key can run code on both ends; there is deliberately
+    no default and a ValueError is raised when no key is configured.
+    """
+    if authkey_file is not None:
+        with open(authkey_file, 'rb') as file:
+            authkey = file.read().strip()
+    else:
+        authkey = os.environ.get(AUTHKEY_ENV, '').encode()
+    if not authkey:
+        raise ValueError(f"No authkey configured, set {AUTHKEY_ENV} or pass --authkey-file")
+    return authkey
+
+def list_data_files(data_dir):
+    return sorted(os.path.abspath(os.path.join(data_dir, f)) for f in os.listdir(data_dir) if f.startswith('phone_calls') and f.endswith('.txt'))
+
+def split_files(files, chunk_size=DEFAULT_CHUNK_SIZE, max_rejects=None):
+    """
+    Splits every file into byte ranges of at most `chunk_size` bytes.
+    Range boundaries do not need to fall on line breaks, `read_range`
+    takes care of assigning each line to exactly one range. Every task
+    carries `max_rejects` so workers can fail fast on their own.
+    """
+    tasks = []
+    for file_name in files:
+        size = os.path.getsize(file_name)
+        for start in range(0, size, chunk_size):
+            tasks.append((len(tasks), file_name, start, min(start + chunk_size, size), max_rejects))
+    return tasks
+
+def read_range(file_name, start, end):
+    """
+    Reads the lines that start inside the byte range [start, end) using memory
+    mapping. A line crossing `start` belongs to the previous range and a line
+    crossing `end` is read in full, so adjacent ranges never overlap or drop lines.
+    Returns the byte offset of the first line read and the lines.
+    """
+    with open(file_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return start, []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mmapped_file:
+            if start > 0 and mmapped_file[start - 1:start] != b'\n':
+                newline = mmapped_file.find(b'\n', start)
+                start = len(mmapped_file) if newline == -1 else newline + 1
+            mmapped_file.seek(start)
+            lines = []
+            while mmapped_file.tell() < end:
+                line = mmapped_file.readline()
+                if not line:
+                    break
+                lines.append(line.decode('utf-8', 'surrogateescape'))
+    return start, lines
+
+def map_range(file_name, start, end, max_rejects=None):
+    """
+    Builds the partial aggregate of one byte range: {area_code: {phone_number:
+    [epoch seconds, ...]}} with sorted timestamps. The call count of a number is
+    the length of its list, and epoch ints keep the message small on the wire.
+    Rejected lines are returned alongside as in `cores.process_chunk`.
+    """
+    start, lines = read_range(file_name, start, end)
+    rejects = []
+    local_phone_calls_dict = process_lines(lines, file_name, start, rejects, max_rejects)
+    partial = {
+        area_code: {
+            phone_number: sorted(int((ts - EPOCH) / timedelta(seconds=1)) for ts in timestamps)
+            for phone_number, timestamps in numbers.items()
+        }
+        for area_code, numbers in local_phone_calls_dict.items()
+    }
+    return partial, rejects
+
+def reduce_partials(partials):
+    phone_calls_dict = defaultdict(lambda: defaultdict(list))
+
+    for partial in partials:
+        for area_code, numbers in partial.items():
+            for phone_number, timestamps in numbers.items():
+                phone_calls_dict[area_code][phone_number].extend(EPOCH + timedelta(seconds=ts) for ts in timestamps)
+
+    return phone_calls_dict
+
+class Coordinator:
+    """
+    Hands out byte range tasks to workers connecting over TCP and collects
+    their partial aggregates.
+
+    Each connected worker is served by its own thread which sends one task at a
+    time and waits for the result. If the connection drops, or no result arrives
+    within `task_timeout` seconds (a host that lost power or was cut off never
+    closes the connection), the task goes back on the queue for another worker
+    and that worker is dropped. A task that
+    fails `max_attempts` times aborts the run with a RuntimeError, and so does
+    an exception raised by a worker, since it would repeat on any other worker,
+    and a reply the coordinator cannot read.
+    The run also fails when work is left but no worker has been connected for
+    `worker_timeout` seconds.
+    """
+    def __init__(self, tasks, authkey, address=DEFAULT_ADDRESS, max_attempts=3, worker_timeout=DEFAULT_WORKER_TIMEOUT,
+                 task_timeout=DEFAULT_TASK_TIMEOUT):
+        self.pending = deque(tasks)
+        self.remaining = len(tasks)
+        self.attempts = defaultdict(int)
+        self.results = {}
+        self.error = None
+        self.max_attempts = max_attempts
+        self.worker_timeout = worker_timeout
+        self.task_timeout = task_timeout
+        self.workers = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+    def next_task(self):
+        with self.condition:
+            while not self.pending and self.remaining > 0 and self.error is None:
+                self.condition.wait()
+            if self.remaining == 0 or self.error is not None:
+                return None
+            return self.pending.popleft()
+
+    def complete(self, task, partial):
+        with self.condition:
+            task_id = task[0]
+            if task_id not in self.results:
+                self.results[task_id] = partial
+                self.remaining -= 1
+            self.condition.notify_all()
+
+    def fail(self, error):
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            self.condition.notify_all()
+
+    def retry(self, task):
+        with self.condition:
+            task_id = task[0]
+            self.attempts[task_id] += 1
+            if self.attempts[task_id] >= self.max_attempts:
+                self.error = RuntimeError(f"Task {task_id} ({task[1]} bytes {task[2]}-{task[3]}) failed {self.attempts[task_id]} times")
+            else:
+                self.pending.append(task)
+            self.condition.notify_all()
+
+    def serve_worker(self, conn):
+        try:
+            self.serve_tasks(conn)
+        finally:
+            with self.condition:
+                self.workers -= 1
+                self.condition.notify_all()
+
+    def serve_tasks(self, conn):
+        with conn:
+            while True:
+                task = self.next_task()
+                if task is None:
+                    try:
+                        conn.send(None)
+                    except OSError:
+                        pass
+                    return
+                try:
+                    conn.send(task)
+                    if not conn.poll(self.task_timeout):
+                        self.retry(task)
+                        return
+                    task_id, partial, error = conn.recv()
+                except (EOFError, OSError):
+                    self.retry(task)
+                    return
+                except Exception as e:
+                    self.fail(RuntimeError(f"Task {task[0]} ({task[1]} bytes {task[2]}-{task[3]}) got an unreadable reply: {e!r}"))
+                    return
+                if isinstance(error, TooManyRejectsError):
+                    self.fail(error)
+                    return
+                if error is not None:
+                    self.fail(RuntimeError(f"Task {task_id} ({task[1]} bytes {task[2]}-{task[3]}) failed on a worker: {error}"))
+                    return
+                self.complete(task, partial)
+
+    def accept_workers(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (ConnectionError, EOFError, AuthenticationError):
+                # A connection that dropped or failed the handshake, such as a
+                # port scan or health check, must not stop accepting workers
+                continue
+            except OSError:
+                if self.closed:
+                    return
+                continue
+            with self.condition:
+                self.workers += 1
+            threading.Thread(target=self.serve_worker, args=(conn,), daemon=True).start()
+
+    def run(self):
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+        with self.condition:
+            idle_since = time.monotonic()
+            while self.remaining > 0 and self.error is None:
+                if self.workers > 0:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > self.worker_timeout:
+                    self.error = RuntimeError(f"No workers connected for {self.worker_timeout} seconds with {self.remaining} tasks left")
+                    self.condition.notify_all()
+                    break
+                self.condition.wait(timeout=1)
+        self.closed = True
+        self.listener.close()
+        if self.error is not None:
+            raise self.error
+        return [self.results[task_id] for task_id in sorted(self.results)]
+
+def run_worker(authkey, address=DEFAULT_ADDRESS):
+    """
+    Processes tasks until the coordinator sends None. An exception raised while
+    processing a task is reported back instead of taking the worker down.
+    """
+    with Client(address, authkey=authkey) as conn:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                return
+            if task is None:
+                return
+            task_id, file_name, start, end, max_rejects = task
+            try:
+                partial = map_range(file_name, start, end, max_rejects)
+            except TooManyRejectsError as e:
+                conn.send((task_id, None, e))
+            except Exception as e:
+                conn.send((task_id, None, f"{type(e).__name__}: {e}"))
+            else:
+                conn.send((task_id, partial, None))
+
+def run_coordinator(data_dir, authkey, address=DEFAULT_ADDRESS, chunk_size=DEFAULT_CHUNK_SIZE, local_workers=0,
+                    reject_file='rejects.txt', max_rejects=None, worker_timeout=DEFAULT_WORKER_TIMEOUT,
+                    task_timeout=DEFAULT_TASK_TIMEOUT):
+    """
+    Splits the data files into byte range tasks, serves them to workers and
+    reduces the partial aggregates into the usual phone calls dict. Workers on
+    other hosts connect with `python distributed.py worker`; `local_workers`
+    additionally starts that many worker processes on this host. Tasks carry
+    absolute paths, so remote workers need the data directory mounted at the
+    same path as on the coordinator. Rejected lines
+    are handled as in `cores.load_phone_calls_dict`, and the same
+    (phone calls dict, reject counts) pair is returned.
+    """
+    coordinator = Coordinator(split_files(list_data_files(data_dir), chunk_size, max_rejects), authkey, address,
+                              worker_timeout=worker_timeout, task_timeout=task_timeout)
+    workers = [Process(target=run_worker, args=(authkey, coordinator.address)) for _ in range(local_workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        results = coordinator.run()
+    except TooManyRejectsError as e:
+        export_rejects(e.rejects, reject_file)
+        raise
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    rejects = [reject for _, local_rejects in results for reject in local_rejects]
+    export_rejects(rejects, reject_file)
+    if max_rejects is not None and len(rejects) > max_rejects:
+        raise TooManyRejectsError(f"{len(rejects)} rejected lines exceed the limit of {max_rejects}, see {reject_file}")
+    phone_calls_dict = reduce_partials(partial for partial, _ in results)
+    return phone_calls_dict, Counter(reason for _, _, reason, _ in rejects)
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    return (host or 'localhost', int(port))
+
+def main():
+    parser = argparse.ArgumentParser(description="Spread phone call ingest across worker processes over TCP.")
+    parser.add_argument('role', choices=['coordinator', 'worker'])
+    parser.add_argument('--address', type=parse_address, default=DEFAULT_ADDRESS, help="host:port the coordinator listens on")
+    parser.add_argument('--authkey-file', default=None, help=f"file holding the shared secret, defaults to ${AUTHKEY_ENV}")
+    parser.add_argument('--worker-timeout', type=float, default=DEFAULT_WORKER_TIMEOUT,
+                        help="seconds to wait with no worker connected before giving up")
+    parser.add_argument('--task-timeout', type=float, default=DEFAULT_TASK_TIMEOUT,
+                        help="seconds to wait for a task result before handing the task to another worker")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="bytes per task")
+    parser.add_argument('--local-workers', type=int, default=0, help="worker processes to start on this host")
+    parser.add_argument('--reject-file', default='rejects.txt', help="where malformed lines are written")
+    parser.add_argument('--force-full-report', action='store_true', help="rewrite every redials report file")
+    parser.add_argument('--max-rejects', type=int, default=None, help="fail once more than this many lines are rejected")
+    args = parser.parse_args()
+    try:
+        authkey = read_authkey(args.authkey_file)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.role == 'worker':
+        run_worker(authkey, args.address)
+        return
+
+    start_time = time.time()
+    phone_calls_dict, reject_counts = run_coordinator(args.data_dir, authkey, args.address, args.chunk_size, args.local_workers,
+                                                      args.reject_file, args.max_rejects, args.worker_timeout,
+                                                      args.task_timeout)
+    if reject_counts:
+        print(f"Rejected {sum(reject_counts.values())} lines: {dict(reject_counts)}")
+    phone_call_counts = generate_phone_call_counts(phone_calls_dict)
+    most_frequent_list = most_frequently_called(phone_call_counts, 10)
+    export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
+    written = export_redials_report(phone_calls_dict, 'redials_report', force=args.force_full_report)
+    print(f"Rewrote {len(written)} of {len(phone_calls_dict)} redials report files")
+    stop_time = time.time()
+    print(f"Execution time: {stop_time - start_time} seconds")
+
+if __name__ == '__main__':
+    main()
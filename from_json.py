@@ -1,15 +1,54 @@
 import json
 import os
 import time
-from datetime import datetime
+import argparse
+from datetime import datetime, timedelta
 from multiprocessing import Pool, cpu_count
 
 output_json_path = "output.json" 
 
-start = time.time()
-with open(output_json_path, 'r') as file:
-    phone_calls_dict = json.load(file)
-end = time.time()
+EPOCH = datetime(1970, 1, 1)
+
+def load_json(json_path):
+    with open(json_path, 'r') as file:
+        return json.load(file)
+
+def load_ndjson_shard(shard_path):
+    """
+    Parses a single NDJSON shard written by `to_json.export_ndjson_shards`
+    one record at a time, returning {phone_number: [datetime, ...]}.
+    """
+    ac_data = {}
+    with open(shard_path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            ac_data[record["number"]] = [EPOCH + timedelta(seconds=ts) for ts in record["timestamps"]]
+    return ac_data
+
+def load_manifest(shard_dir):
+    with open(os.path.join(shard_dir, 'manifest.json'), 'r') as file:
+        return json.load(file)
+
+def process_shard(args):
+    area_code, shard_path, report_dir = args
+    ac_data = load_ndjson_shard(shard_path)
+    write_area_report(area_code, ac_data, report_dir)
+    return {phone_number: len(calls) for phone_number, calls in ac_data.items()}
+
+def stream_shards(shard_dir, report_dir):
+    """
+    Parses the shards listed in the manifest in parallel, each worker writing
+    its own area code report, and yields the per-number call counts of each
+    shard as soon as it is done. Only one shard per worker is held in memory
+    at a time, never the whole document.
+    """
+    manifest = load_manifest(shard_dir)
+    tasks = [(shard["area_code"], os.path.join(shard_dir, shard["file"]), report_dir) for shard in manifest["shards"]]
+    with Pool(processes=cpu_count()) as pool:
+        for counts in pool.imap_unordered(process_shard, tasks):
+            yield counts
 
 def generate_phone_call_counts(phone_calls_dict):
     phone_call_counts = {}
@@ -33,10 +72,15 @@ def export_phone_call_counts(most_frequent_list, out_file_path):
 
 def process_area_code(args):
     area_code, ac_data, report_dir = args
+    parsed = {phone_number: [datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S") for ts in call_data]
+              for phone_number, call_data in ac_data.items()}
+    write_area_report(area_code, parsed, report_dir)
+
+def write_area_report(area_code, ac_data, report_dir):
     report = []
 
     for phone_number, call_data in sorted(ac_data.items()):
-        sorted_timestamps = [datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S") for ts in call_data]
+        sorted_timestamps = sorted(call_data)
 
         for i in range(len(sorted_timestamps) - 1):
             timestamp_1 = sorted_timestamps[i]
@@ -45,7 +89,7 @@ def process_area_code(args):
             time_delta = timestamp_2 - timestamp_1
             sec_diff = time_delta.total_seconds()
 
-            if 0 <= sec_diff < 600:
+            if sec_diff < 600:
                 time_str_1 = timestamp_1.strftime("%Y-%m-%d %H:%M:%S")  
                 time_str_2 = timestamp_2.strftime("%H:%M:%S")
                 minutes, seconds = divmod(int(sec_diff), 60)
@@ -66,15 +110,33 @@ def export_redials_report(phone_calls_dict, report_dir):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--json', default=output_json_path, help="monolithic JSON document to load")
+    source.add_argument('--ndjson-shards', metavar='SHARD_DIR', default=None,
+                        help="stream the NDJSON shards in SHARD_DIR instead of loading a JSON document")
+    args = parser.parse_args()
+
     #start_time = time.time()
     #data_dir = 'data' 
     #file = jload_phone_calls_dict(data_dir))
     time_start = time.time()
-    print(f'Loading data from {output_json_path} took {end - start} seconds')
-    phone_call_counts = generate_phone_call_counts(phone_calls_dict)
-    most_frequent_list = most_frequently_called(phone_call_counts, 10)
-    export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
-    export_redials_report(phone_calls_dict, 'redials_report')
+    if args.ndjson_shards:
+        os.makedirs('redials_report', exist_ok=True)
+        phone_call_counts = {}
+        for counts in stream_shards(args.ndjson_shards, 'redials_report'):
+            phone_call_counts.update(counts)
+        most_frequent_list = most_frequently_called(phone_call_counts, 10)
+        export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
+    else:
+        start = time.time()
+        phone_calls_dict = load_json(args.json)
+        end = time.time()
+        print(f'Loading data from {args.json} took {end - start} seconds')
+        phone_call_counts = generate_phone_call_counts(phone_calls_dict)
+        most_frequent_list = most_frequently_called(phone_call_counts, 10)
+        export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
+        export_redials_report(phone_calls_dict, 'redials_report')
     stop_time = time.time()
     print(f"Execution time: {stop_time - time_start} seconds")
 
@@ -0,0 +1,275 @@
+import os
+import mmap
+import math
+import time
+import random
+import bisect
+import hashlib
+import argparse
+from collections import Counter, defaultdict
+from multiprocessing import Pool, cpu_count
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+def list_files(data_dir):
+    return sorted(f for f in os.listdir(data_dir) if os.path.isfile(os.path.join(data_dir, f)))
+
+def split_ranges(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    size = os.path.getsize(file_path)
+    return [(file_path, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+def line_start(mmapped_file, pos):
+    """
+    Returns the offset of the first line starting at or after `pos`. Every line
+    belongs to the byte range its first byte falls into, so adjacent ranges
+    never overlap or drop lines.
+    """
+    if pos == 0 or mmapped_file[pos - 1:pos] == b'\n':
+        return pos
+    newline = mmapped_file.find(b'\n', pos)
+    return len(mmapped_file) if newline == -1 else newline + 1
+
+def line_end(mmapped_file, pos, end):
+    newline = mmapped_file.find(b'\n', pos, end)
+    return end if newline == -1 else newline + 1
+
+def iter_lines(mmapped_file, start, end):
+    pos = line_start(mmapped_file, start)
+    end = line_start(mmapped_file, end)
+    while pos < end:
+        next_pos = line_end(mmapped_file, pos, end)
+        yield mmapped_file[pos:next_pos]
+        pos = next_pos
+
+def split_line(line):
+    """
+    Returns the (area_code, phone_number) of a raw `timestamp: number` line.
+    Malformed lines get empty values and end up in a stratum of their own.
+    """
+    phone_number = line.partition(b': ')[2].strip()
+    bracket = phone_number.find(b'(')
+    area_code = phone_number[bracket + 1:bracket + 4] if bracket != -1 else b''
+    return area_code, phone_number
+
+def number_hash(seed, phone_number):
+    digest = hashlib.blake2b(phone_number, digest_size=8, key=str(seed).encode()).digest()
+    return int.from_bytes(digest, 'big')
+
+def map_file(file_path):
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def skip_sample_range(task):
+    """
+    Bernoulli(p) sampling of the lines of one byte range using geometric skips.
+
+    Instead of drawing a random number per line, the number of lines until the
+    next selected one is drawn from a geometric distribution and the lines in
+    between are skipped with `mmap.find`, without being decoded or parsed. The
+    generator is seeded from the run seed and the range so every range samples
+    the same lines no matter which process handles it.
+    """
+    file_path, start, end, p, seed = task
+    if p <= 0:
+        return b''
+    mmapped_file = map_file(file_path)
+    if mmapped_file is None:
+        return b''
+    rng = random.Random(f"{seed}:{os.path.basename(file_path)}:{start}")
+    log_q = math.log(1 - p) if p < 1 else None
+    selected = []
+
+    with mmapped_file:
+        pos = line_start(mmapped_file, start)
+        end = line_start(mmapped_file, end)
+        while pos < end:
+            skip = 0 if log_q is None else int(math.log(1.0 - rng.random()) / log_q)
+            for _ in range(skip):
+                pos = line_end(mmapped_file, pos, end)
+                if pos >= end:
+                    break
+            if pos >= end:
+                break
+            next_pos = line_end(mmapped_file, pos, end)
+            selected.append(mmapped_file[pos:next_pos])
+            pos = next_pos
+    return b''.join(selected)
+
+def count_range(task):
+    file_path, start, end = task
+    mmapped_file = map_file(file_path)
+    if mmapped_file is None:
+        return Counter()
+    with mmapped_file:
+        return Counter(split_line(line)[0] for line in iter_lines(mmapped_file, start, end))
+
+def numbers_range(task):
+    file_path, start, end = task
+    mmapped_file = map_file(file_path)
+    numbers = defaultdict(set)
+    if mmapped_file is None:
+        return numbers
+    with mmapped_file:
+        for line in iter_lines(mmapped_file, start, end):
+            area_code, phone_number = split_line(line)
+            numbers[area_code].add(phone_number)
+    return numbers
+
+def quota_sample_range(task):
+    """
+    Keeps the lines of one byte range whose per-area index is in `selected`,
+    a dict of area code to the set of indices chosen for this range.
+    """
+    file_path, start, end, selected = task
+    mmapped_file = map_file(file_path)
+    if mmapped_file is None:
+        return b''
+    seen = Counter()
+    kept = []
+    with mmapped_file:
+        for line in iter_lines(mmapped_file, start, end):
+            area_code = split_line(line)[0]
+            if seen[area_code] in selected.get(area_code, ()):
+                kept.append(line)
+            seen[area_code] += 1
+    return b''.join(kept)
+
+_selected_numbers = None
+
+def init_number_filter(selected_numbers):
+    global _selected_numbers
+    _selected_numbers = selected_numbers
+
+def number_sample_range(task):
+    """
+    Keeps every line of the selected phone numbers, so redial chains stay
+    intact. Without an explicit selection a number is kept when its keyed hash
+    falls below `p`, which needs no coordination between files or processes.
+    """
+    file_path, start, end, p, seed = task
+    mmapped_file = map_file(file_path)
+    if mmapped_file is None:
+        return b''
+    threshold = int(p * 2 ** 64)
+    kept = []
+    with mmapped_file:
+        for line in iter_lines(mmapped_file, start, end):
+            phone_number = split_line(line)[1]
+            if _selected_numbers is not None:
+                if phone_number in _selected_numbers:
+                    kept.append(line)
+            elif number_hash(seed, phone_number) < threshold:
+                kept.append(line)
+    return b''.join(kept)
+
+def allocate_line_quotas(tasks, counts, p, seed):
+    """
+    Draws round(p * N) line indices per area code over the whole data set and
+    splits them into per range index sets using the per range counts.
+    """
+    totals = Counter()
+    range_starts = []
+    for range_counts in counts:
+        range_starts.append(dict(totals))
+        totals.update(range_counts)
+
+    selected = [defaultdict(set) for _ in tasks]
+    for area_code, total in totals.items():
+        rng = random.Random(f"{seed}:{area_code.decode('utf-8', 'replace')}")
+        indices = sorted(rng.sample(range(total), round(p * total)))
+        for i, range_counts in enumerate(counts):
+            first = range_starts[i].get(area_code, 0)
+            last = first + range_counts.get(area_code, 0)
+            lo, hi = bisect.bisect_left(indices, first), bisect.bisect_left(indices, last)
+            if hi > lo:
+                selected[i][area_code] = {index - first for index in indices[lo:hi]}
+    return [dict(s) for s in selected]
+
+def select_numbers(numbers_per_range, p, seed):
+    """
+    Picks round(p * N) numbers per area code, ranked by their keyed hash so the
+    choice is reproducible and independent of file order.
+    """
+    numbers = defaultdict(set)
+    for range_numbers in numbers_per_range:
+        for area_code, area_numbers in range_numbers.items():
+            numbers[area_code].update(area_numbers)
+
+    selected = set()
+    for area_code, area_numbers in numbers.items():
+        ranked = sorted(area_numbers, key=lambda number: number_hash(seed, number))
+        selected.update(ranked[:round(p * len(ranked))])
+    return selected
+
+def create_dev_set(full_data_dir, dev_data_dir, ratio=10, seed=None, by='line', stratify=False,
+                   chunk_size=DEFAULT_CHUNK_SIZE, processes=None):
+    """
+    Writes a `ratio` percent sample of every file in `full_data_dir` to a file
+    of the same name in `dev_data_dir`.
+
+    by='line' samples individual lines, by='number' keeps or drops all lines of
+    a phone number together. stratify=True makes the sample hold exactly
+    round(ratio% of) the lines or numbers of every area code, at the cost of a
+    counting pass over the data. Files are split into byte ranges which are
+    sampled in parallel. The same seed always produces the same dev set; for
+    unstratified line sampling the chunk size has to match as well, since
+    every range draws its own skips. Returns the seed used.
+    """
+    if by not in ('line', 'number'):
+        raise ValueError(f"by must be 'line' or 'number', not {by!r}")
+    if not 0 <= ratio <= 100:
+        raise ValueError(f"ratio must be a percentage between 0 and 100, not {ratio}")
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    p = ratio / 100
+
+    os.makedirs(dev_data_dir, exist_ok=True)
+    file_names = list_files(full_data_dir)
+    file_tasks = {name: split_ranges(os.path.join(full_data_dir, name), chunk_size) for name in file_names}
+    all_tasks = [task for name in file_names for task in file_tasks[name]]
+
+    initializer, initargs = None, ()
+    if stratify:
+        with Pool(processes or cpu_count()) as pool:
+            if by == 'line':
+                quotas = allocate_line_quotas(all_tasks, pool.map(count_range, all_tasks), p, seed)
+                quota_by_task = dict(zip(all_tasks, quotas))
+            else:
+                initializer, initargs = init_number_filter, (select_numbers(pool.map(numbers_range, all_tasks), p, seed),)
+
+    with Pool(processes or cpu_count(), initializer, initargs) as pool:
+        for name in file_names:
+            if by == 'line' and stratify:
+                func, tasks = quota_sample_range, [task + (quota_by_task[task],) for task in file_tasks[name]]
+            elif by == 'line':
+                func, tasks = skip_sample_range, [task + (p, seed) for task in file_tasks[name]]
+            else:
+                func, tasks = number_sample_range, [task + (p, seed) for task in file_tasks[name]]
+
+            with open(os.path.join(dev_data_dir, name), 'wb') as file_dev:
+                for sample in pool.imap(func, tasks):
+                    file_dev.write(sample)
+    return seed
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a reproducible sampled dev set of the phone call data.")
+    parser.add_argument('full_data_dir')
+    parser.add_argument('dev_data_dir')
+    parser.add_argument('--ratio', type=float, default=10, help="percentage of lines or numbers to keep")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--by', choices=['line', 'number'], default='line', help="sample single lines or whole phone numbers")
+    parser.add_argument('--stratify', action='store_true', help="keep exactly the ratio of every area code")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="bytes per parallel task")
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    seed = create_dev_set(args.full_data_dir, args.dev_data_dir, args.ratio, args.seed, args.by, args.stratify,
+                          args.chunk_size, args.processes)
+    stop_time = time.time()
+    print(f"Created dev set with seed {seed} in {stop_time - start_time} seconds")
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,8 @@
 import os
 from datetime import datetime
 import time
-import random
 from collections import defaultdict, Counter
 
-def create_dev_set(full_data_dir, dev_data_dir, ratio=10):
-    os.makedirs(dev_data_dir, exist_ok=True)
-    for file_name in sorted(os.listdir(full_data_dir)):
-        with open(f'{full_data_dir}/{file_name}') as file_full,\
-                open(f'{dev_data_dir}/{file_name}', 'w') as file_dev:
-            for line in file_full:
-                rand_num = random.randint(0, 100)
-                if rand_num < ratio:
-                    file_dev.write(line)
-
 def load_phone_calls_dict(data_dir):
     phone_calls_dict = defaultdict(lambda: defaultdict(list))
     
@@ -0,0 +1,121 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import cores
+
+GOOD = "2020-01-01 00:12:04: +1(412)677-2698\n"
+
+
+def write_data(data_dir, content):
+    data_dir.mkdir(exist_ok=True)
+    with open(data_dir / 'phone_calls_test.txt', 'wb') as file:
+        file.write(content)
+
+
+def read_rejects(reject_file):
+    with open(reject_file, 'rb') as file:
+        return [line.split(b'\t') for line in file.read().splitlines()]
+
+
+def test_bad_lines_are_rejected_with_their_offset(tmp_path):
+    content = (GOOD + "garbage\n" + GOOD + "2020-13-01 00:12:04: +1(412)677-2698\n").encode() + b'\xff\xfe bad\n' + b'\n'
+    write_data(tmp_path / 'data', content)
+    reject_file = tmp_path / 'rejects.txt'
+
+    phone_calls_dict, reject_counts = cores.load_phone_calls_dict(tmp_path / 'data', reject_file)
+
+    assert phone_calls_dict['412']['+1(412)677-2698'] and len(phone_calls_dict['412']['+1(412)677-2698']) == 2
+    assert reject_counts == {'malformed': 1, 'invalid timestamp': 1, 'invalid encoding': 1}
+    rejects = read_rejects(reject_file)
+    assert [int(reject[1]) for reject in rejects] == [content.index(b'garbage'), content.index(b'2020-13'), content.index(b'\xff')]
+    assert rejects[2][3] == b'\xff\xfe bad'
+
+
+def test_non_ascii_digits_are_rejected(tmp_path):
+    write_data(tmp_path / 'data', (GOOD + "２０２０-01-01 00:12:04: +1(４12)677-2698\n").encode())
+
+    phone_calls_dict, reject_counts = cores.load_phone_calls_dict(tmp_path / 'data', tmp_path / 'rejects.txt')
+
+    assert list(phone_calls_dict) == ['412']
+    assert reject_counts == {'malformed': 1}
+
+
+def test_clean_run_leaves_no_reject_file(tmp_path):
+    write_data(tmp_path / 'data', GOOD.encode())
+    reject_file = tmp_path / 'rejects.txt'
+    reject_file.write_text("stale\n")
+
+    _, reject_counts = cores.load_phone_calls_dict(tmp_path / 'data', reject_file)
+
+    assert not reject_counts
+    assert not os.path.exists(reject_file)
+
+
+def test_max_rejects_writes_the_rejects_gathered_so_far(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for i in range(3):
+        with open(data_dir / f'phone_calls_{i}.txt', 'w') as file:
+            file.write(GOOD + f"garbage {i}\n")
+    reject_file = tmp_path / 'rejects.txt'
+
+    with pytest.raises(cores.TooManyRejectsError) as excinfo:
+        cores.load_phone_calls_dict(data_dir, reject_file, max_rejects=1)
+
+    assert len(excinfo.value.rejects) > 1
+    assert len(read_rejects(reject_file)) == len(excinfo.value.rejects)
+
+
+def calls(*timestamps):
+    return [datetime.strptime(ts, '%Y-%m-%d %H:%M:%S') for ts in timestamps]
+
+
+def report_mtimes(report_dir):
+    return {name: os.stat(os.path.join(report_dir, name)).st_mtime_ns for name in os.listdir(report_dir)}
+
+
+@pytest.fixture
+def phone_calls_dict():
+    return {
+        '412': {'+1(412)677-2698': calls('2020-01-01 00:12:04', '2020-01-01 00:15:42')},
+        '555': {'+1(555)847-4291': calls('2020-01-02 03:59:22', '2020-01-02 04:01:00')},
+    }
+
+
+def test_unchanged_reports_are_not_rewritten(tmp_path, phone_calls_dict):
+    report_dir = str(tmp_path / 'report')
+
+    assert sorted(cores.export_redials_report(phone_calls_dict, report_dir)) == ['412', '555']
+    mtimes = report_mtimes(report_dir)
+    assert cores.export_redials_report(phone_calls_dict, report_dir) == []
+    assert report_mtimes(report_dir) == mtimes
+
+    phone_calls_dict['555']['+1(555)847-4291'] += calls('2020-01-02 04:05:00')
+    assert cores.export_redials_report(phone_calls_dict, report_dir) == ['555']
+    assert report_mtimes(report_dir)['412.txt'] == mtimes['412.txt']
+    assert open(os.path.join(report_dir, '555.txt')).read().count('\n') == 2
+
+    assert sorted(cores.export_redials_report(phone_calls_dict, report_dir, force=True)) == ['412', '555']
+
+
+def test_vanished_area_is_pruned(tmp_path, phone_calls_dict):
+    report_dir = str(tmp_path / 'report')
+    cores.export_redials_report(phone_calls_dict, report_dir)
+
+    del phone_calls_dict['555']
+    assert cores.export_redials_report(phone_calls_dict, report_dir) == []
+
+    assert sorted(os.listdir(report_dir)) == ['.fingerprints.json', '412.txt']
+    assert list(cores.load_fingerprints(report_dir)) == ['412']
+
+
+@pytest.mark.parametrize('content', ['[1, 2]', '{"version": 3}', '{"version": 3, "areas": [1]}', 'not json'])
+def test_malformed_fingerprints_regenerate_everything(tmp_path, phone_calls_dict, content):
+    report_dir = str(tmp_path / 'report')
+    cores.export_redials_report(phone_calls_dict, report_dir)
+    with open(os.path.join(report_dir, cores.FINGERPRINT_FILE), 'w') as file:
+        file.write(content)
+
+    assert sorted(cores.export_redials_report(phone_calls_dict, report_dir)) == ['412', '555']
@@ -0,0 +1,193 @@
+import os
+import time
+import socket
+import threading
+from multiprocessing import Process
+from multiprocessing.connection import Client
+
+import pytest
+
+import cores
+import distributed
+from cores import TooManyRejectsError
+
+AUTHKEY = b'test-authkey'
+
+LINES = [
+    "2020-01-01 00:12:04: +1(412)677-2698\n",
+    "2020-01-01 00:15:42: +1(412)677-2698\n",
+    "2020-01-01 01:50:42: +1(412)847-4291\n",
+    "2020-01-01 03:59:22: +1(555)847-4291\n",
+] * 25
+
+
+def take_task_and_exit(address):
+    conn = Client(address, authkey=AUTHKEY)
+    conn.recv()
+    os._exit(1)
+
+
+def take_task_and_stall(address):
+    conn = Client(address, authkey=AUTHKEY)
+    conn.recv()
+    time.sleep(60)
+
+
+def take_task_and_reply_garbage(address):
+    conn = Client(address, authkey=AUTHKEY)
+    conn.recv()
+    conn.send('garbage')
+    conn.recv()
+
+
+def sorted_calls(phone_calls_dict):
+    return {area_code: {number: sorted(calls) for number, calls in numbers.items()}
+            for area_code, numbers in phone_calls_dict.items()}
+
+
+def run_in_thread(coordinator):
+    outcome = {}
+
+    def target():
+        try:
+            outcome['results'] = coordinator.run()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    with open(tmp_path / 'phone_calls_test.txt', 'w') as file:
+        file.writelines(LINES)
+    return tmp_path
+
+
+def test_task_of_dead_worker_is_retried(data_dir):
+    tasks = distributed.split_files(distributed.list_data_files(data_dir), 500)
+    coordinator = distributed.Coordinator(tasks, AUTHKEY, ('localhost', 0))
+    thread, outcome = run_in_thread(coordinator)
+
+    quitter = Process(target=take_task_and_exit, args=(coordinator.address,))
+    quitter.start()
+    quitter.join()
+    worker = Process(target=distributed.run_worker, args=(AUTHKEY, coordinator.address))
+    worker.start()
+    thread.join(timeout=30)
+    worker.join(timeout=5)
+
+    assert 'error' not in outcome
+    assert sum(coordinator.attempts.values()) == 1
+    phone_calls_dict = distributed.reduce_partials(partial for partial, _ in outcome['results'])
+    assert sum(len(calls) for numbers in phone_calls_dict.values() for calls in numbers.values()) == len(LINES)
+
+
+def test_task_of_stalled_worker_is_retried(data_dir):
+    tasks = distributed.split_files(distributed.list_data_files(data_dir), 500)
+    coordinator = distributed.Coordinator(tasks, AUTHKEY, ('localhost', 0), task_timeout=1)
+    thread, outcome = run_in_thread(coordinator)
+
+    staller = Process(target=take_task_and_stall, args=(coordinator.address,), daemon=True)
+    staller.start()
+    worker = Process(target=distributed.run_worker, args=(AUTHKEY, coordinator.address))
+    worker.start()
+    thread.join(timeout=30)
+    worker.join(timeout=5)
+    staller.terminate()
+
+    assert 'error' not in outcome
+    assert len(outcome['results']) == len(tasks)
+
+
+def test_raw_connection_does_not_stop_accepting(data_dir):
+    tasks = distributed.split_files(distributed.list_data_files(data_dir), 500)
+    coordinator = distributed.Coordinator(tasks, AUTHKEY, ('localhost', 0), worker_timeout=5)
+    thread, outcome = run_in_thread(coordinator)
+
+    socket.create_connection(coordinator.address).close()
+    worker = Process(target=distributed.run_worker, args=(AUTHKEY, coordinator.address))
+    worker.start()
+    thread.join(timeout=30)
+    worker.join(timeout=5)
+
+    assert 'error' not in outcome
+    assert len(outcome['results']) == len(tasks)
+
+
+def test_unreadable_reply_fails_the_run(data_dir):
+    tasks = distributed.split_files(distributed.list_data_files(data_dir), 500)
+    coordinator = distributed.Coordinator(tasks, AUTHKEY, ('localhost', 0))
+    thread, outcome = run_in_thread(coordinator)
+
+    client = Process(target=take_task_and_reply_garbage, args=(coordinator.address,))
+    client.start()
+    thread.join(timeout=30)
+    client.join(timeout=5)
+
+    assert 'unreadable reply' in str(outcome['error'])
+
+
+def test_several_local_workers_match_cores(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for i in range(3):
+        with open(data_dir / f'phone_calls_{i}.txt', 'w') as file:
+            file.writelines(LINES[i:] + LINES[:i])
+
+    # 50 byte ranges cut most lines in the middle
+    phone_calls_dict, reject_counts = distributed.run_coordinator(
+        data_dir, AUTHKEY, ('localhost', 0), chunk_size=50, local_workers=3, reject_file=tmp_path / 'rejects.txt')
+    expected, _ = cores.load_phone_calls_dict(data_dir, reject_file=tmp_path / 'cores_rejects.txt')
+
+    assert not reject_counts
+    assert sorted_calls(phone_calls_dict) == sorted_calls(expected)
+
+
+def test_worker_exception_fails_the_run(tmp_path):
+    tasks = [(0, str(tmp_path / 'missing.txt'), 0, 100, None)]
+    coordinator = distributed.Coordinator(tasks, AUTHKEY, ('localhost', 0))
+    thread, outcome = run_in_thread(coordinator)
+
+    worker = Process(target=distributed.run_worker, args=(AUTHKEY, coordinator.address))
+    worker.start()
+    thread.join(timeout=30)
+    worker.join(timeout=5)
+
+    assert 'FileNotFoundError' in str(outcome['error'])
+
+
+def test_workers_fail_fast_on_rejects(tmp_path):
+    with open(tmp_path / 'phone_calls_test.txt', 'wb') as file:
+        file.write(''.join(LINES[:2]).encode())
+        file.write(b'\xff\xfe bad\n')
+        file.write(b'garbage\n')
+    reject_file = tmp_path / 'rejects.txt'
+
+    with pytest.raises(TooManyRejectsError):
+        distributed.run_coordinator(tmp_path, AUTHKEY, ('localhost', 0), local_workers=1,
+                                    reject_file=reject_file, max_rejects=1)
+
+    with open(reject_file, 'rb') as file:
+        rejects = file.read().splitlines()
+    offset = len(''.join(LINES[:2]).encode())
+    assert rejects[0].split(b'\t')[1:] == [str(offset).encode(), b'invalid encoding', b'\xff\xfe bad']
+    assert len(rejects) == 2
+
+
+def test_run_fails_without_workers(data_dir):
+    tasks = distributed.split_files(distributed.list_data_files(data_dir))
+    coordinator = distributed.Coordinator(tasks, AUTHKEY, ('localhost', 0), worker_timeout=1)
+
+    with pytest.raises(RuntimeError, match="No workers connected"):
+        coordinator.run()
+
+
+def test_read_authkey_has_no_default(monkeypatch):
+    monkeypatch.delenv(distributed.AUTHKEY_ENV, raising=False)
+    with pytest.raises(ValueError):
+        distributed.read_authkey()
+    monkeypatch.setenv(distributed.AUTHKEY_ENV, 'secret')
+    assert distributed.read_authkey() == b'secret'
@@ -0,0 +1,41 @@
+import os
+
+import cores
+import from_json
+import to_json
+
+LINES = [
+    "2020-01-01 00:12:04: +1(412)677-2698\n",
+    "2020-01-01 00:15:42: +1(412)677-2698\n",
+    "2020-01-01 01:50:42: +1(412)847-4291\n",
+    "2020-01-01 07:59:22: +1(412)847-4291\n",
+    "2020-01-02 03:59:22: +1(555)847-4291\n",
+    "2020-01-02 04:01:00: +1(555)847-4291\n",
+]
+
+
+def read_reports(report_dir):
+    return {name: open(os.path.join(report_dir, name)).read() for name in os.listdir(report_dir) if name.endswith('.txt')}
+
+
+def test_ndjson_shards_round_trip(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    # Split over two files so the shards have to merge numbers across inputs
+    with open(data_dir / 'phone_calls_a.txt', 'w') as file:
+        file.writelines(LINES[1::2])
+    with open(data_dir / 'phone_calls_b.txt', 'w') as file:
+        file.writelines(LINES[0::2])
+    phone_calls_dict, _ = cores.load_phone_calls_dict(data_dir, reject_file=tmp_path / 'rejects.txt')
+    cores.export_redials_report(phone_calls_dict, tmp_path / 'expected')
+
+    to_json.export_ndjson_shards(phone_calls_dict, tmp_path / 'shards')
+    report_dir = tmp_path / 'report'
+    report_dir.mkdir()
+    phone_call_counts = {}
+    for counts in from_json.stream_shards(tmp_path / 'shards', report_dir):
+        phone_call_counts.update(counts)
+
+    assert phone_call_counts == cores.generate_phone_call_counts(phone_calls_dict)
+    assert read_reports(report_dir) == read_reports(tmp_path / 'expected')
+    assert read_reports(report_dir)['555.txt'] == "+1(555)847-4291: 2020-01-02 03:59:22 -> 04:01:00 (01:38)\n"
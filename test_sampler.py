@@ -0,0 +1,85 @@
+import os
+from collections import Counter, defaultdict
+
+import pytest
+
+import sampler
+
+
+def numbers_of(area_code, count):
+    return [f"+1({area_code}){i:03d}-{i:04d}" for i in range(count)]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / 'full'
+    data_dir.mkdir()
+    numbers = numbers_of('412', 40) + numbers_of('555', 15)
+    for f in range(2):
+        with open(data_dir / f'phone_calls_{f}.txt', 'w') as file:
+            for i in range(300):
+                number = numbers[(i * 7 + f) % len(numbers)]
+                file.write(f"2020-01-0{f + 1} {i // 60:02d}:{i % 60:02d}:00: {number}\n")
+    return data_dir
+
+
+def read_dir(dev_dir):
+    return {name: open(os.path.join(dev_dir, name), 'rb').read() for name in sorted(os.listdir(dev_dir))}
+
+
+def all_lines(data_dir):
+    return [line for content in read_dir(data_dir).values() for line in content.splitlines()]
+
+
+def area_counts(lines):
+    return Counter(sampler.split_line(line)[0] for line in lines)
+
+
+def calls_by_number(lines):
+    calls = defaultdict(list)
+    for line in lines:
+        calls[sampler.split_line(line)[1]].append(line)
+    return calls
+
+
+@pytest.mark.parametrize('by', ['line', 'number'])
+@pytest.mark.parametrize('stratify', [False, True])
+def test_same_seed_gives_same_dev_set(tmp_path, data_dir, by, stratify):
+    for run in ('a', 'b'):
+        sampler.create_dev_set(data_dir, tmp_path / run, ratio=20, seed=7, by=by, stratify=stratify,
+                               chunk_size=1000, processes=2)
+
+    assert read_dir(tmp_path / 'a') == read_dir(tmp_path / 'b')
+    assert sorted(read_dir(tmp_path / 'a')) == ['phone_calls_0.txt', 'phone_calls_1.txt']
+
+
+def test_stratified_lines_keep_exact_quota_per_area(tmp_path, data_dir):
+    sampler.create_dev_set(data_dir, tmp_path / 'dev', ratio=10, seed=1, stratify=True,
+                           chunk_size=1000, processes=2)
+
+    full_counts = area_counts(all_lines(data_dir))
+    dev_lines = all_lines(tmp_path / 'dev')
+    assert area_counts(dev_lines) == {area: round(0.1 * n) for area, n in full_counts.items()}
+    assert set(dev_lines) <= set(all_lines(data_dir))
+
+
+def test_stratified_numbers_keep_exact_quota_per_area(tmp_path, data_dir):
+    sampler.create_dev_set(data_dir, tmp_path / 'dev', ratio=10, seed=1, by='number', stratify=True,
+                           chunk_size=1000, processes=2)
+
+    full_numbers = calls_by_number(all_lines(data_dir))
+    dev_numbers = calls_by_number(all_lines(tmp_path / 'dev'))
+    full_areas = Counter(number[3:6] for number in full_numbers)
+    assert Counter(number[3:6] for number in dev_numbers) == {area: round(0.1 * n) for area, n in full_areas.items()}
+
+
+@pytest.mark.parametrize('stratify', [False, True])
+def test_by_number_keeps_whole_numbers(tmp_path, data_dir, stratify):
+    sampler.create_dev_set(data_dir, tmp_path / 'dev', ratio=30, seed=3, by='number', stratify=stratify,
+                           chunk_size=1000, processes=2)
+
+    full_numbers = calls_by_number(all_lines(data_dir))
+    dev_numbers = calls_by_number(all_lines(tmp_path / 'dev'))
+    assert dev_numbers
+    for number, calls in dev_numbers.items():
+        assert calls == full_numbers[number]
@@ -1,10 +1,14 @@
 import os
 from datetime import datetime
 from multiprocessing import Pool, cpu_count
-from collections import defaultdict
-import mmap
 import time
 import json
+import argparse
+from datetime import timedelta
+
+from cores import read_file, build_chunks, process_chunks
+
+EPOCH = datetime(1970, 1, 1)
 
 class DateTimeEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -12,61 +16,21 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
-def process_lines(lines):
-    local_phone_calls_dict = {}
-
-    for line in lines:
-        timestamp_str, phone_number = line.strip().split(': ')
-        area_code = phone_number.split('(')[1][:3]
-        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-
-        if 0 <= timestamp.hour < 6:
-            if area_code not in local_phone_calls_dict:
-                local_phone_calls_dict[area_code] = {}
-            if phone_number not in local_phone_calls_dict[area_code]:
-                local_phone_calls_dict[area_code][phone_number] = []
-            local_phone_calls_dict[area_code][phone_number].append(timestamp)
-
-    return local_phone_calls_dict
-
-def read_file(file_name):
-    with open(file_name, "r") as f:
-        mmapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        lines = []
-        line = mmapped_file.readline()  # Reading the first line
-        while line:
-            lines.append(line.decode('utf-8'))  # Decode bytes to string
-            line = mmapped_file.readline()  # Read the next line
-    return lines
-
-def load_phone_calls_dict(data_dir):
-    phone_calls_dict = defaultdict(lambda: defaultdict(list))
-
+def load_phone_calls_dict(data_dir, reject_file='rejects.txt', max_rejects=None):
     files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith('phone_calls') and f.endswith('.txt')]
     
     num_processes = cpu_count()
     
     with Pool(num_processes) as pool:
         all_lines_lists = pool.map(read_file, files)
-        
-    all_lines = [line for sublist in all_lines_lists for line in sublist]
     
-    chunk_size = len(all_lines) // num_processes
-    chunks = [all_lines[i:i + chunk_size] for i in range(0, len(all_lines), chunk_size)]
+    chunks = build_chunks(files, all_lines_lists, num_processes, max_rejects)
     
     with Pool(num_processes) as pool:
-        results = pool.map(process_lines, chunks)
-
-    for local_dict in results:
-        for area_code, numbers in local_dict.items():
-            for phone_number, timestamps in numbers.items():
-                phone_calls_dict[area_code][phone_number].extend(timestamps)
-
-    with open('phone_calls_dict.json', 'w') as file:
-        json.dump(phone_calls_dict, file, indent=2, cls=DateTimeEncoder)
+        phone_calls_dict, reject_counts = process_chunks(pool, chunks, reject_file, max_rejects)
 
     plain_dict = {k: dict(v) for k, v in phone_calls_dict.items()}
-    return plain_dict
+    return plain_dict, reject_counts
     #return phone_calls_dict
 
 def generate_phone_call_counts(phone_calls_dict):
@@ -118,15 +82,67 @@ def export_redials_report(phone_calls_dict, report_dir):
             if report:
                 file.write('\n'.join(report)+'\n')
 
+def export_json(phone_calls_dict, json_path):
+    with open(json_path, 'w') as file:
+        json.dump(phone_calls_dict, file, indent=2, cls=DateTimeEncoder)
+
+def to_epoch(timestamp):
+    return int((timestamp - EPOCH) / timedelta(seconds=1))
+
+def export_ndjson_shards(phone_calls_dict, shard_dir):
+    """
+    Writes one compact NDJSON shard per area code plus a manifest.
+
+    Each line of `<shard_dir>/<area_code>.ndjson` is a single record
+    `{"number": ..., "timestamps": [...]}` with the timestamps sorted and
+    stored as epoch seconds, so a reader can parse the shards independently
+    and one record at a time instead of loading a single large document.
+    `manifest.json` lists every shard with its record and call counts.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+
+    for area_code, ac_data in sorted(phone_calls_dict.items()):
+        shard_name = f"{area_code}.ndjson"
+        num_calls = 0
+
+        with open(os.path.join(shard_dir, shard_name), 'w') as file:
+            for phone_number, call_data in sorted(ac_data.items()):
+                timestamps = sorted(to_epoch(ts) for ts in call_data)
+                num_calls += len(timestamps)
+                record = {"number": phone_number, "timestamps": timestamps}
+                file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+        shards.append({
+            "area_code": area_code,
+            "file": shard_name,
+            "numbers": len(ac_data),
+            "calls": num_calls,
+        })
+
+    with open(os.path.join(shard_dir, 'manifest.json'), 'w') as file:
+        json.dump({"version": 1, "timestamp_format": "epoch", "shards": shards}, file, indent=2)
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ndjson-shards', metavar='SHARD_DIR', default=None,
+                        help="write NDJSON shards to SHARD_DIR instead of the pretty-printed phone_calls_dict.json")
+    args = parser.parse_args()
+
     start_time = time.time()
     data_dir = 'data' 
     #file = jload_phone_calls_dict(data_dir)
-    phone_calls_dict = load_phone_calls_dict(data_dir)
+    phone_calls_dict, reject_counts = load_phone_calls_dict(data_dir)
+    if reject_counts:
+        print(f"Rejected {sum(reject_counts.values())} lines: {dict(reject_counts)}")
     phone_call_counts = generate_phone_call_counts(phone_calls_dict)
     most_frequent_list = most_frequently_called(phone_call_counts, 10)
     export_phone_call_counts(most_frequent_list, 'phone_call_counts.txt')
     export_redials_report(phone_calls_dict, 'redials_report')
+    if args.ndjson_shards:
+        export_ndjson_shards(phone_calls_dict, args.ndjson_shards)
+    else:
+        export_json(phone_calls_dict, 'phone_calls_dict.json')
     stop_time = time.time()
     print(f"Execution time: {stop_time - start_time} seconds")
 